@@ -16,114 +16,392 @@ The user then needs to use SILNLP https://github.com/sillsdev/silnlp to extract
 
 # Import modules and directory paths
 import argparse
+import atexit
+import json
 
 # import codecs
 # import ntpath
 import os
-
-# import re
 import shutil
-from csv import DictReader, DictWriter
-from datetime import datetime
-from glob import iglob
-from os import listdir
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 from pathlib import Path
-from random import randint
-from time import sleep, strftime
-from typing import Dict, List, Tuple
+from time import localtime, monotonic, sleep, strftime, time
+from typing import Dict, List, Optional, TextIO, Tuple
 
-import pandas as pd
-import regex
 import requests
 import yaml
-from bs4 import BeautifulSoup
-from pandas.core.groupby import groupby
+from lxml import etree, html as lxml_html
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from settings_file import write_settings_file
 
-global headers
+# Use the libyaml parser when PyYAML was built with it.
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 headers: Dict[str, str] = {
     "Accept-Encoding": "gzip, deflate",
-    "Connection": "keep-alive",
     "Upgrade-Insecure-Requests": "1",
     "User-Agent": "Mozilla/5.0",
 }
 
+# Each download thread holds one connection from the pool while it runs, so
+# there can't be more download workers than connections.
+max_download_workers = 16
+
+# Reuse one pool of connections to eBible.org for all downloads.
+# The Session keeps connections alive itself, so no Connection header is set.
+session = requests.Session()
+session.headers.update(headers)
+session.mount(
+    "https://",
+    HTTPAdapter(
+        # All the requests go to the one host.
+        pool_connections=1,
+        pool_maxsize=max_download_workers,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            # Once the retries run out, hand back the last error response
+            # rather than raising. download_file then returns None for it and
+            # download_one logs it as a file that could not be downloaded.
+            raise_on_status=False,
+        ),
+    ),
+)
+
+
+# The columns of the licences file.
+licence_column_headers = [
+    "ID",
+    "File",
+    "Language",
+    "Dialect",
+    "Vernacular Title",
+    "Licence Type",
+    "Licence Version",
+    "CC Licence Link",
+    "Copyright Holder",
+    "Copyright Years",
+    "Translation by",
+]
+
+# copr.htm files are a few KB. Only this much of one is read.
+copr_max_bytes = 1 << 20
+
+# copr.htm files are utf-8 whether or not they say so in a <meta> tag.
+copr_parser = lxml_html.HTMLParser(encoding="utf-8")
+
+# XPath queries for copr.htm, compiled once rather than for every file.
+# The first link to creativecommons.org gives the licence.
+cc_link_xpath = etree.XPath("(//*[contains(@href, 'creativecommons')])[1]/@href")
+# The link to the project's page on eBible.org holds its vernacular title.
+title_link_xpath = etree.XPath("//body//*[contains(@href, $url)]")
+# The strings of the first paragraph hold the copyright details.
+first_paragraph_xpath = etree.XPath("(//body//p)[1]//text()")
+
+# The labels in front of the dialect in copr.htm.
+dialect_descriptions = ("Dialect (if applicable): ", "Dialect: ")
+
+# The ways a true value is written in translations.csv.
+true_strings = frozenset({"True", "true", "TRUE"})
+
+# Written to each project folder to record the zip file it was unzipped from.
+manifest_filename = ".ebible_source.json"
+
+# Stop messages from different download threads being interleaved.
+log_lock = threading.Lock()
+
+# Log files are opened once and kept open for the rest of the run.
+log_files: Dict[str, TextIO] = {}
+
+# The log timestamp only changes once a second, so keep the last one formatted.
+log_second: int = -1
+log_timestamp: str = ""
+
 
 # Define methods for downloading and unzipping eBibles
+def get_log_file(file) -> TextIO:
+    # Buffer the writes, everything logged is printed to the console as well.
+    log = log_files.get(str(file))
+    if log is None:
+        log = log_files[str(file)] = open(file, "a", buffering=1 << 16)
+    return log
+
+
+@atexit.register
+def close_log_files() -> None:
+    with log_lock:
+        for log in log_files.values():
+            log.close()
+        log_files.clear()
+
+
+def get_log_timestamp() -> str:
+    # Call with log_lock held.
+    global log_second, log_timestamp
+
+    now = time()
+    if int(now) != log_second:
+        log_second = int(now)
+        log_timestamp = strftime("%Y-%m-%d %H:%M:%S", localtime(now))
+    return log_timestamp
+
+
 def log_and_print(file, messages, log_type="Info") -> None:
 
-    if isinstance(messages, str):
-        with open(file, "a") as log:
-            log.write(
-                f"{log_type}: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {messages}\n"
-            )
+    with log_lock:
+        # Format the timestamp once, even when logging a list of messages.
+        timestamp = get_log_timestamp()
+        log = get_log_file(file)
+
+        if isinstance(messages, str):
+            log.write(f"{log_type}: {timestamp} {messages}\n")
             print(messages)
 
-    if isinstance(messages, list):
-        with open(file, "a") as log:
+        if isinstance(messages, list):
             for message in messages:
-                log.write(
-                    f"{log_type}: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {message}\n"
-                )
+                log.write(f"{log_type}: {timestamp} {message}\n")
                 print(message)
 
 
+class RateLimiter:
+    """A token bucket that lets `burst` requests start at once, then `rate` a second.
+
+    The rate is halved each time the server asks us to slow down, and creeps
+    back up to the starting rate as requests succeed.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.max_rate: float = rate
+        self.rate: float = rate
+        self.burst: int = burst
+        self.tokens: float = burst
+        self.last_time: float = monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.last_time) * self.rate
+            )
+            self.last_time = now
+            # Take a token now, and wait for it if the bucket was empty.
+            self.tokens -= 1
+            delay = -self.tokens / self.rate
+        if delay > 0:
+            sleep(delay)
+
+    def slow_down(self) -> None:
+        with self.lock:
+            self.rate = max(self.rate / 2, self.max_rate / 16)
+
+    def speed_up(self) -> None:
+        with self.lock:
+            self.rate = min(self.rate * 1.1, self.max_rate)
+
+
+@lru_cache(maxsize=None)
+def load_config(config_file: Path) -> Dict:
+    """Return the contents of config.yaml, only reading the file the first time."""
+    with open(config_file, "r") as yamlfile:
+        return yaml.load(yamlfile, Loader=SafeLoader)
+
+
 def make_directories(dirs_to_create) -> None:
     for dir_to_create in dirs_to_create:
         dir_to_create.mkdir(parents=True, exist_ok=True)
 
 
-def download_file(url, file, headers=headers):
+def load_http_cache(cache_file: Path) -> Dict[str, Dict[str, str]]:
+    """Return the ETag and Last-Modified headers saved for each downloaded url."""
+    if cache_file.is_file():
+        with open(cache_file, "r", encoding="utf-8") as cache:
+            return json.load(cache)
+    return {}
 
-    r = requests.get(url, headers=headers)
-    # If the status is OK continue
-    if r.status_code == requests.codes.ok:
 
-        with open(file, "wb") as out_file:
-            # Write out the content of the page.
-            out_file.write(r.content)
+def save_http_cache(cache_file: Path, http_cache: Dict[str, Dict[str, str]]) -> None:
+    with open(cache_file, "w", encoding="utf-8") as cache:
+        json.dump(http_cache, cache, indent=2, sort_keys=True)
 
-        return file
-    return None
 
+def download_file(url, file, session=session, http_cache=None, rate_limiter=None):
 
-def download_files(files, base_url, folder, logfile, redownload=False) -> list:
+    # Ask the server to send the file only if it changed since it was saved.
+    request_headers = {}
+    if http_cache is not None and file.is_file():
+        validators = http_cache.get(url, {})
+        if "ETag" in validators:
+            request_headers["If-None-Match"] = validators["ETag"]
+        if "Last-Modified" in validators:
+            request_headers["If-Modified-Since"] = validators["Last-Modified"]
 
-    downloaded_files = []
+    with session.get(url, headers=request_headers, stream=True, timeout=30) as r:
 
-    for i, file in enumerate(files):
+        # Retries have already waited as long as the server asked. If it is
+        # still too busy, start the remaining downloads more slowly.
+        if rate_limiter is not None:
+            if r.status_code in (
+                requests.codes.too_many_requests,
+                requests.codes.service_unavailable,
+            ):
+                rate_limiter.slow_down()
+            else:
+                rate_limiter.speed_up()
+
+        # The local copy is still current.
+        if r.status_code == requests.codes.not_modified:
+            return file
+
+        # If the status is OK continue
+        if r.status_code == requests.codes.ok:
+
+            # Write to a .part file and rename it when complete, so that an
+            # interrupted download never leaves a truncated file behind.
+            part_file = file.with_name(file.name + ".part")
+            with open(part_file, "wb") as out_file:
+                # Copy straight from the socket to the file as it arrives,
+                # undoing any gzip or deflate transfer encoding on the way.
+                r.raw.decode_content = True
+                shutil.copyfileobj(r.raw, out_file, length=1024 * 1024)
+            os.replace(part_file, file)
+
+            if http_cache is not None:
+                http_cache[url] = {
+                    header: r.headers[header]
+                    for header in ("ETag", "Last-Modified")
+                    if header in r.headers
+                }
+
+            return file
+    return None
 
-        # Construct the download url and the local file path.
-        url = base_url + file.name
-        file = folder / file.name
 
-        # Skip existing files that contain data.
-        if file.exists() and file.stat().st_size > 100:
+def is_up_to_date(url, file, session=session) -> bool:
+    """Return True if the local file has the same size as the remote file and isn't older."""
 
-            if redownload:
-                log_and_print(logfile, f"{i+1}: Redownloading from {url} to {file}.")
-                if downloaded_file := download_file(url, file):
-                    downloaded_files.append(downloaded_file)
+    r = session.head(url, allow_redirects=True, timeout=30)
+    if r.status_code != requests.codes.ok:
+        return False
 
-                    log_and_print(logfile, f"Saved {url} as {file}\n")
-                    # Pause for a random number of miliseconds
-                    sleep(randint(1, 5000) / 1000)
+    remote_size = r.headers.get("Content-Length")
+    remote_modified = r.headers.get("Last-Modified")
+    if remote_size is None or remote_modified is None:
+        return False
 
-            continue
+    # A malformed header just means the file is downloaded again.
+    try:
+        remote_size = int(remote_size)
+        remote_mtime = parsedate_to_datetime(remote_modified).timestamp()
+    except (TypeError, ValueError):
+        return False
 
+    stat = file.stat()
+    return stat.st_size == remote_size and stat.st_mtime >= remote_mtime
+
+
+def download_one(
+    i, file, base_url, folder, logfile, redownload, rate_limiter, http_cache
+):
+
+    # Construct the download url and the local file path.
+    url = base_url + file.name
+    file = folder / file.name
+
+    # Skip existing files that contain data.
+    try:
+        file_stat = file.stat()
+    except FileNotFoundError:
+        file_stat = None
+    has_data = file_stat is not None and file_stat.st_size > 100
+
+    if has_data and not redownload:
+        return None
+
+    rate_limiter.wait()
+    try:
+        if has_data:
+            # With a saved ETag or Last-Modified the GET is conditional, and the
+            # server answers 304 with no body if the file hasn't changed. Only
+            # fall back to a HEAD request when there is nothing saved to send.
+            if http_cache is not None and http_cache.get(url):
+                log_and_print(logfile, f"{i}: Checking {url} for changes to {file}.")
+            elif is_up_to_date(url, file):
+                log_and_print(logfile, f"{i}: {file} is up to date with {url}.")
+                return None
+            else:
+                log_and_print(logfile, f"{i}: Redownloading from {url} to {file}.")
         else:
-            log_and_print(logfile, f"{i+1}: Downloading from {url} to {file}.")
-            if downloaded_file := download_file(url, file):
-                downloaded_files.append(downloaded_file)
+            log_and_print(logfile, f"{i}: Downloading from {url} to {file}.")
 
-                log_and_print(logfile, f"Saved {url} as {file}\n")
+        downloaded_file = download_file(
+            url, file, http_cache=http_cache, rate_limiter=rate_limiter
+        )
 
-                # Pause for a random number of miliseconds
-                sleep(randint(1, 5000) / 1000)
+    # A timeout, dropped connection or failed write only loses this file.
+    except (requests.RequestException, OSError) as error:
+        file.with_name(file.name + ".part").unlink(missing_ok=True)
+        log_and_print(logfile, f"Could not download {url}: {error}\n")
+        return None
 
-            else:
-                log_and_print(logfile, f"Could not download {url}\n")
+    if downloaded_file:
+        # A 304 response leaves the file as it was.
+        if has_data and file.stat().st_mtime_ns == file_stat.st_mtime_ns:
+            log_and_print(logfile, f"{i}: {file} is up to date with {url}.")
+            return None
+
+        log_and_print(logfile, f"Saved {url} as {file}\n")
+        return downloaded_file
+
+    log_and_print(logfile, f"Could not download {url}\n")
+    return None
+
+
+def download_files(
+    files,
+    base_url,
+    folder,
+    logfile,
+    redownload=False,
+    max_workers=8,
+    requests_per_second=4,
+    http_cache=None,
+) -> list:
+
+    downloaded_files = []
+
+    # Download several files at once, but start no more than
+    # requests_per_second downloads each second to be kind to eBible.org.
+    rate_limiter = RateLimiter(requests_per_second, burst=requests_per_second)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                download_one,
+                i,
+                file,
+                base_url,
+                folder,
+                logfile,
+                redownload,
+                rate_limiter,
+                http_cache,
+            )
+            for i, file in enumerate(files, 1)
+        ]
+        for future in as_completed(futures):
+            if downloaded_file := future.result():
+                downloaded_files.append(downloaded_file)
 
     log_and_print(
         logfile,
@@ -132,14 +410,22 @@ def download_files(files, base_url, folder, logfile, redownload=False) -> list:
     return downloaded_files
 
 
-def get_tree_size(path) -> int:
-    """Return total size of files in given path and subdirs."""
+def get_tree_size(path, limit=None) -> int:
+    """Return total size of files in given path and subdirs.
+    If a limit is given, stop adding up sizes once the total reaches it."""
     total: int = 0
-    for entry in os.scandir(path):
-        if entry.is_dir(follow_symlinks=False):
-            total += get_tree_size(entry.path)
-        else:
-            total += entry.stat(follow_symlinks=False).st_size
+    # Walk the tree with a stack of folders, and take file sizes from the
+    # directory entries rather than a separate stat by path.
+    folders = [path]
+    while folders:
+        with os.scandir(folders.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                    continue
+                total += entry.stat(follow_symlinks=False).st_size
+                if limit is not None and total >= limit:
+                    return total
     return total
 
 
@@ -147,17 +433,36 @@ def unzip_ebible(source_file, dest_folder, logfile) -> None:
 
     if dest_folder.is_dir():
         log_and_print(logfile, f"Unzipping from {source_file} to: {dest_folder}")
-        shutil.unpack_archive(source_file, dest_folder)
+        try:
+            with zipfile.ZipFile(source_file) as zip_contents:
+                zip_contents.extractall(dest_folder)
+        except zipfile.BadZipFile:
+            log_and_print(logfile, f"BadZipFile: While trying to unzip: {source_file}")
+        except FileNotFoundError:
+            log_and_print(logfile, f"FileNotFoundError: While trying to unzip: {source_file}")
         # log_and_print(f"Unzipped {source_file} to: {dest_folder}")
 
     else:
         log_and_print(logfile, f"Can't unzip, the destination folder: {dest_folder} doesn't exist.")
 
 
+def get_project_name(zip_name: str, file_suffix: str) -> Optional[str]:
+    """Return the project ID from a zip file name, or None if it lacks the suffix."""
+    if not file_suffix or not zip_name.endswith(file_suffix):
+        return None
+    return zip_name[: -len(file_suffix)]
+
+
 def unzip_entire_folder(source_folder, file_suffix, unzip_folder, logfile) -> int:
     log_and_print(logfile, f"\nStarting unzipping eBible zip files...")
     pattern = "*" + file_suffix
-    zip_files = sorted([zip_file for zip_file in source_folder.glob(pattern)])
+    # The zips are extracted in whatever order the threads finish, so there is
+    # no point sorting them.
+    zip_files = [
+        Path(entry.path)
+        for entry in os.scandir(source_folder)
+        if entry.name.endswith(file_suffix) and entry.is_file()
+    ]
     log_and_print(
         logfile,
         f"Found {len(zip_files)} files in {source_folder} matching pattern: {pattern}",
@@ -165,17 +470,13 @@ def unzip_entire_folder(source_folder, file_suffix, unzip_folder, logfile) -> in
 
     # Strip off the pattern so that the subfolder name is the project ID.
     extract_folders = [
-        (
-            zip_file,
-            unzip_folder
-            / f"{zip_file.name[0: (len(zip_file.name) - len(file_suffix))]}",
-        )
+        (zip_file, unzip_folder / get_project_name(zip_file.name, file_suffix))
         for zip_file in zip_files
     ]
     extracts = [
         (zip_file, folder)
         for zip_file, folder in extract_folders
-        if not folder.exists()
+        if not is_extracted(zip_file, folder)
     ]
 
     log_and_print(
@@ -183,179 +484,315 @@ def unzip_entire_folder(source_folder, file_suffix, unzip_folder, logfile) -> in
         f"Found {len(extracts)} that were not yet extracted.\n",
     )
 
-    for zip_file, extract in extracts:
+    def extract_zip(zip_file: Path, extract: Path) -> None:
+        # Remove the files from an older version of the zip file, if there are any.
+        shutil.rmtree(extract, ignore_errors=True)
         extract.mkdir(parents=True, exist_ok=True)
         log_and_print(logfile, f"Extracting to: {extract}")
-        shutil.unpack_archive(zip_file, extract)
+        with zipfile.ZipFile(zip_file) as zf:
+            zf.extractall(extract)
+        write_manifest(zip_file, extract)
+
+    # zlib releases the GIL while it decompresses, so threads are enough here.
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = [
+            executor.submit(extract_zip, zip_file, extract)
+            for zip_file, extract in extracts
+        ]
+        for future in as_completed(futures):
+            future.result()
 
     # log_and_print(logfile, f"Finished unzipping eBible files\n")
 
     return len(extracts)
 
 
+def get_zip_details(zip_file: Path) -> Dict:
+    zip_stat = zip_file.stat()
+    return {"zip": zip_file.name, "size": zip_stat.st_size, "mtime": zip_stat.st_mtime}
+
+
+def write_manifest(zip_file: Path, folder: Path) -> None:
+    # Record which zip file was unzipped, so unchanged projects are skipped next time.
+    with open(folder / manifest_filename, "w", encoding="utf-8") as manifest:
+        json.dump(get_zip_details(zip_file), manifest)
+
+
+def is_extracted(zip_file: Path, folder: Path) -> bool:
+    """Return True if the folder holds the contents of this version of the zip file."""
+
+    # Most folders have a manifest, so open it first rather than checking for
+    # the folder and the manifest separately.
+    try:
+        with open(folder / manifest_filename, "r", encoding="utf-8") as manifest_file:
+            return json.load(manifest_file) == get_zip_details(zip_file)
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+
+    # Folders unzipped before manifests were written are left alone, unless
+    # they are empty or the zip file has been downloaded again since.
+    if not folder.is_dir():
+        return False
+    with os.scandir(folder) as entries:
+        if next(entries, None) is None:
+            return False
+    return folder.stat().st_mtime >= zip_file.stat().st_mtime
+
+
+def unzip_project(zip_file: Path, unzip_to_folder: Path) -> Tuple[Path, str]:
+    """Unzip a project and add its Settings.xml file.
+
+    This runs in a worker process, so any error message is returned for the caller to log.
+    """
+
+    # Unzip into a .part folder next to the project folder, so that a bad zip
+    # file never replaces the files from an older version that unzipped well.
+    part_folder = unzip_to_folder.with_name(unzip_to_folder.name + ".part")
+    shutil.rmtree(part_folder, ignore_errors=True)
+    part_folder.mkdir(parents=True)
+    try:
+        with zipfile.ZipFile(zip_file) as zip_contents:
+            zip_contents.extractall(part_folder)
+    except zipfile.BadZipFile:
+        shutil.rmtree(part_folder, ignore_errors=True)
+        return unzip_to_folder, f"BadZipFile: While trying to unzip: {zip_file}"
+    except FileNotFoundError:
+        shutil.rmtree(part_folder, ignore_errors=True)
+        return unzip_to_folder, f"FileNotFoundError: While trying to unzip: {zip_file}"
+
+    # Remove the files from an older version of the zip file, if there are any.
+    shutil.rmtree(unzip_to_folder, ignore_errors=True)
+    os.replace(part_folder, unzip_to_folder)
+
+    write_settings_file(unzip_to_folder)
+
+    write_manifest(zip_file, unzip_to_folder)
+
+    return unzip_to_folder, ""
+
+
 def unzip_files(
     zip_files: List[Path],
     unzip_folder: Path,
     also_check: Path,
     file_suffix: str,
     logfile,
+    overwrite: bool = False,
 ) -> List[Path]:
 
     # Keep track of which files were unzipped
     unzipped = []
+    unzips = []
     # Strip off the file_suffix so that the unzip folder name is the project ID.
     for zip_file in zip_files:
-        project_foldername = (
-            f"{zip_file.name[0: (len(zip_file.name) - len(file_suffix))]}"
-        )
+        project_foldername = get_project_name(zip_file.name, file_suffix)
+        if not project_foldername:
+            # Don't make a folder named after a file that isn't a project zip.
+            log_and_print(logfile, f"Skipping {zip_file}, it doesn't end with {file_suffix}")
+            continue
         unzip_to_folder = unzip_folder / project_foldername
         also_check_folder = also_check / project_foldername
-        if not unzip_to_folder.exists() and not also_check_folder.exists():
+
+        # Re-extract a project where it is, if it has already been moved.
+        if also_check_folder.exists():
+            unzip_to_folder = also_check_folder
+
+        if overwrite or not is_extracted(zip_file, unzip_to_folder):
             # The file still needs to be unzipped.
+            unzips.append((zip_file, unzip_to_folder))
+
+    # Most runs find nothing new, so don't start worker processes for nothing.
+    if not unzips:
+        return unzipped
 
-            unzip_to_folder.mkdir(parents=True, exist_ok=True)
+    # Each project is independent, so unzip them in parallel. Processes rather
+    # than threads, since writing Settings.xml scans the USFM in Python.
+    with ProcessPoolExecutor() as executor:
+        futures = []
+        for zip_file, unzip_to_folder in unzips:
             log_and_print(logfile, f"Extracting to: {unzip_to_folder}")
-            try:
-                shutil.unpack_archive(zip_file, unzip_to_folder)
+            futures.append(executor.submit(unzip_project, zip_file, unzip_to_folder))
+
+        for future in as_completed(futures):
+            unzip_to_folder, error = future.result()
+            if error:
+                log_and_print(logfile, error)
+            else:
                 unzipped.append(unzip_to_folder)
-            except shutil.ReadError:
-                log_and_print(logfile, f"ReadError: While trying to unzip: {zip_file}")
-            except FileNotFoundError:
-                log_and_print(
-                    logfile, f"FileNotFoundError: While trying to unzip: {zip_file}"
-                )
 
     return unzipped
 
 
 def get_redistributable(translations_csv: Path) -> Tuple[List[Path], List[Path]]:
+    # pandas is imported where it is used, since it is slow to import and the
+    # worker processes don't need it.
+    import pandas as pd
+
+    # Only parse the two columns that are needed. Keep the values as strings and
+    # don't let pandas turn IDs such as "nan" into missing values.
+    translations = pd.read_csv(
+        translations_csv,
+        usecols=["translationId", "Redistributable"],
+        dtype=str,
+        na_filter=False,
+    )
+
+    all_files: List = translations["translationId"].tolist()
+    # Compare with the spellings of true directly, rather than lower-casing every value.
+    redistributable_files: List = translations.loc[
+        translations["Redistributable"].isin(true_strings), "translationId"
+    ].tolist()
 
-    redistributable_files: List = []
-    all_files: List = []
+    return all_files, redistributable_files
 
-    with open(translations_csv, encoding="utf-8-sig", newline="") as csvfile:
-        reader = DictReader(csvfile, delimiter=",", quotechar='"')
-        for row in reader:
-            all_files.append(row["translationId"])
 
-            if row["Redistributable"] == "True":
-                redistributable_files.append(row["translationId"])
+# Quotes and brackets are dropped from column names and spaces become underscores.
+column_name_table = str.maketrans({'"': None, "'": None, "(": None, ")": None, " ": "_"})
 
-        return all_files, redistributable_files
 
 # Columns are easier to use if they are valid python identifiers:
 def improve_column_names(df) -> None:
-    df.columns = (
-        df.columns.str.strip()
-        .str.lower()
-        .str.replace('"', "")
-        .str.replace("'", "")
-        .str.replace("(", "")
-        .str.replace(")", "")
-        .str.replace(" ", "_")
-    )
+    df.columns = [
+        column.strip().lower().translate(column_name_table) for column in df.columns
+    ]
 
 
-def get_licence_details(logfile, folder) -> List:
-
-    column_headers = [
-        "ID",
-        "File",
-        "Language",
-        "Dialect",
-        "Vernacular Title",
-        "Licence Type",
-        "Licence Version",
-        "CC Licence Link",
-        "Copyright Holder",
-        "Copyright Years",
-        "Translation by",
-    ]
+def get_only_string(element) -> Optional[str]:
+    """Return the text of an element that holds a single string, like BeautifulSoup's Tag.string."""
 
-    # Get copyright info from eBible projects
+    if len(element) == 0:
+        return element.text or None
+    # A single child element, with no text before or after it.
+    if len(element) == 1 and not element.text and not element[0].tail:
+        child = element[0]
+        if child.tag is etree.Comment:
+            return child.text
+        return get_only_string(child)
+    return None
 
-    data = list()
-    copr_regex = r".*[/\\](?P<id>.*?)[/\\]copr.htm"
 
-    log_and_print(
-        logfile, f"\nCollecting eBible copyright information from projects in {folder}"
-    )
+def parse_cc_licence(ref: str) -> Optional[Tuple[str, str]]:
+    """Split a Creative Commons link such as .../licenses/by-sa/4.0/ into type and version."""
 
-    for i, copyright_file in enumerate(sorted(folder.glob("**/copr.htm"))):
-        entry = dict.fromkeys(column_headers)
-        entry["ID"] = str(copyright_file.parents[0].relative_to(folder))
+    _, licenses, after = ref.partition("/licenses/")
+    if not licenses:
+        return None
 
-        id_match = regex.match(copr_regex, str(copyright_file))
+    # The type is up to the next slash and the version runs to the last slash.
+    licence_type, slash, rest = after.partition("/")
+    last_slash = rest.rfind("/")
+    if slash and last_slash >= 0:
+        return licence_type, rest[:last_slash]
 
-        if not id_match:
-            print(f"Can't match {copr_regex} to str{copyright_file}.")
-            exit()
+    # Links such as .../licenses/by/4.0 with no slash after the version.
+    if after.startswith("by"):
+        last_slash = after.rfind("/")
+        if last_slash >= 0:
+            return "by", after[2:last_slash]
+
+    return None
+
+
+def get_licence_entry(copyright_file: Path) -> Dict:
+    """Read the licence details from one copr.htm file.
+
+    This runs in a worker process.
+    """
+
+    entry = dict.fromkeys(licence_column_headers)
+
+    # The project ID is the name of the project folder that holds copr.htm.
+    id = copyright_file.parent.name
+
+    entry["ID"] = id
+    entry["File"] = copyright_file
+
+    # Pass the raw bytes so that lxml decodes them, not Python.
+    # The details are at the top, so don't read all of an oversized file.
+    with open(copyright_file, "rb") as copr:
+        html = copr.read(copr_max_bytes)
+
+    doc = lxml_html.document_fromstring(html, parser=copr_parser)
+
+    cclinks = cc_link_xpath(doc)
+    if cclinks:
+        ref = str(cclinks[0])
+        if ref:
+            entry["CC Licence Link"] = ref
+            licence = parse_cc_licence(ref)
+            if licence:
+                entry["Licence Type"], entry["Licence Version"] = licence
+
+    cclinks = None
+
+    title_url = f"https://ebible.org/{id}"
+    titlelinks = title_link_xpath(doc, url=title_url)
+    if titlelinks:
+        entry["Vernacular Title"] = get_only_string(titlelinks[0])
+    titlelinks = None
+
+    copy_strings = [s.strip() for s in first_paragraph_xpath(doc) if s.strip()]
+
+    for i, copy_string in enumerate(copy_strings):
+        if i == 0 and "copyright ©" in copy_string:
+            entry["Copyright Years"] = copy_string
+            entry["Copyright Holder"] = copy_strings[i + 1]
+        if i > 0 and "Language:" in copy_string:
+            entry["Language"] = copy_strings[i + 1]
+
+        if "Dialect" in copy_string:
+            if copy_string.startswith(dialect_descriptions):
+                # Each description ends with the only ": " in it.
+                entry["Dialect"] = copy_string.split(": ", 1)[1]
+            else:
+                entry["Dialect"] = copy_string
+
+        if "Translation by" in copy_string:
+            entry["Translation by"] = copy_string
+        if "Public Domain" in copy_string:
+            entry["Copyright Years"] = ""
+            entry["Copyright Holder"] = "Public Domain"
+
+    return entry
 
-        else:
-            id = id_match["id"]
+
+def get_licence_details(logfile, folder, project_folders=None) -> Dict[str, List]:
+
+    # Get copyright info from eBible projects
+    # Collect a list of values for each column, ready to make a DataFrame.
+    data = {column_header: [] for column_header in licence_column_headers}
+
+    log_and_print(
+        logfile, f"\nCollecting eBible copyright information from projects in {folder}"
+    )
+
+    # The copr.htm files are in the top level of each project folder.
+    # Callers that have already listed the project folders can pass them in.
+    # DirEntry.is_dir() uses the type returned by the directory listing.
+    if project_folders is None:
+        project_folders = [
+            Path(entry.path) for entry in os.scandir(folder) if entry.is_dir()
+        ]
+    copyright_files = []
+    for project_folder in sorted(project_folders, key=lambda path: path.name):
+        copyright_file = project_folder / "copr.htm"
+        if copyright_file.is_file():
+            copyright_files.append(copyright_file)
+
+    # The private projects folder is often empty; don't start a pool for it.
+    if not copyright_files:
+        return data
+
+    # Each copr.htm file is independent, so parse them in parallel.
+    with ProcessPoolExecutor() as executor:
+        entries = executor.map(get_licence_entry, copyright_files, chunksize=32)
+        for i, (copyright_file, entry) in enumerate(zip(copyright_files, entries)):
 
             if i % 250 == 0:
-                print(f"Read {i} files. Now reading: {copyright_file} with ID: {id}")
-
-            entry["ID"] = str(id)
-            entry["File"] = copyright_file
-
-            with open(copyright_file, "r", encoding="utf-8") as copr:
-                html = copr.read()
-                soup = BeautifulSoup(html, "lxml")
-
-            cclink = soup.find(href=regex.compile("creativecommons"))
-            if cclink:
-                ref = cclink.get("href")
-                if ref:
-                    entry["CC Licence Link"] = ref
-                    cc_match = regex.match(
-                        r".*?/licenses/(?P<type>.*?)/(?P<version>.*)/", ref
-                    )
-                    if cc_match:
-                        entry["Licence Type"] = cc_match["type"]
-                        entry["Licence Version"] = cc_match["version"]
-                    else:
-                        cc_by_match = regex.match(
-                            r".*?/licenses/by(?P<version>.*)/", ref
-                        )
-                        if cc_by_match:
-                            # print(f'Licence version = {cc_by_match["version"]}')
-                            entry["Licence Type"] = "by"
-                            entry["Licence Version"] = cc_by_match["version"]
-
-            cclink = None
-
-            titlelink = soup.find(href=regex.compile(f"https://ebible.org/{id}"))
-            if titlelink:
-                entry["Vernacular Title"] = titlelink.string
-            titlelink = None
-
-            copy_strings = [s for s in soup.body.p.stripped_strings]
-
-            for i, copy_string in enumerate(copy_strings):
-                if i == 0 and "copyright ©" in copy_string:
-                    entry["Copyright Years"] = copy_string
-                    entry["Copyright Holder"] = copy_strings[i + 1]
-                if i > 0 and "Language:" in copy_string:
-                    entry["Language"] = copy_strings[i + 1]
-
-                if "Dialect" in copy_string:
-                    descriptions = ["Dialect (if applicable): ", "Dialect: "]
-                    for description in descriptions:
-                        if copy_string.startswith(description):
-                            entry["Dialect"] = copy_string[len(description) :]
-                            break
-                        else:
-                            entry["Dialect"] = copy_string
-
-                if "Translation by" in copy_string:
-                    entry["Translation by"] = copy_string
-                if "Public Domain" in copy_string:
-                    entry["Copyright Years"] = ""
-                    entry["Copyright Holder"] = "Public Domain"
-
-            data.append(entry)
+                print(f"Read {i} files. Now reading: {copyright_file} with ID: {entry['ID']}")
+
+            for column_header in licence_column_headers:
+                data[column_header].append(entry[column_header])
 
     return data
 
@@ -432,10 +869,14 @@ def move_projects(projects_to_move: List, parent_source_folder:Path, parent_dest
         # )
         
         if source_folder.exists() and not dest_folder.exists():
-           shutil.move(str(source_folder), str(dest_folder))
-           assert not source_folder.exists()
-           assert dest_folder.exist()
-           moved.append(project_to_move)
+            # A rename is enough when both folders are on the same filesystem.
+            try:
+                os.rename(source_folder, dest_folder)
+            except OSError:
+                shutil.move(str(source_folder), str(dest_folder))
+            assert not source_folder.exists()
+            assert dest_folder.exists()
+            moved.append(project_to_move)
 
     return moved
 
@@ -483,9 +924,19 @@ def main() -> None:
         action="store_true",
         help="Set this flag to try and download only the non-downloadable exceptions specified in the config.yaml file.",
     )
+    parser.add_argument(
+        "--download_workers",
+        default=8,
+        type=int,
+        help=f"The number of files to download from eBible.org at the same time, at most {max_download_workers}.",
+    )
     parser.add_argument("folder", help="The base folder where others will be created.")
 
     args: argparse.Namespace = parser.parse_args()
+    if not 1 <= args.download_workers <= max_download_workers:
+        parser.error(
+            f"--download_workers must be from 1 to {max_download_workers}."
+        )
     # print(args, type(args))
     # exit()
 
@@ -506,6 +957,8 @@ def main() -> None:
 
     # The csv file to download from eBible.org
     translations_csv: Path = metadata_folder / "translations.csv"
+    # The ETag and Last-Modified headers of previous downloads.
+    http_cache_file: Path = metadata_folder / "http_cache.json"
     settings_filename = "Settings.xml"
 
     # Date stamp for the log file.
@@ -535,6 +988,8 @@ def main() -> None:
         logfile,
     )
 
+    http_cache = load_http_cache(http_cache_file)
+
     # Download the list of translations if necessary.
     if not translations_csv.is_file() or args.force_download:
         log_and_print(
@@ -542,15 +997,15 @@ def main() -> None:
             f"Downloading list of translations from {translations_csv_url} to: {str(translations_csv)}",
             zip,
         )
-        download_file(translations_csv_url, translations_csv)
+        download_file(translations_csv_url, translations_csv, http_cache=http_cache)
+        save_http_cache(http_cache_file, http_cache)
     else:
         log_and_print(
             logfile, f"translations.csv file already exists in: {str(translations_csv)}"
         )
 
     # Get the exceptions from the config.yaml file.
-    with open(Path(__file__).with_name("config.yaml"), "r") as yamlfile:
-        config: Dict = yaml.safe_load(yamlfile)
+    config: Dict = load_config(Path(__file__).with_name("config.yaml"))
 
     dont_download_filenames = [
         project + "_usfm.zip" for project in config["No Download"]
@@ -568,7 +1023,10 @@ def main() -> None:
         downloads_folder,
         logfile,
         redownload=args.force_download,
+        max_workers=args.download_workers,
+        http_cache=http_cache,
         )
+        save_http_cache(http_cache_file, http_cache)
 
         if downloaded_files:
             log_and_print(
@@ -582,10 +1040,10 @@ def main() -> None:
     # These files have fewer than 400 lines of text in January 2023
     dont_download_filenames.extend([ project + "_usfm.zip" for project in config["Short"]])
 
-    dont_download_files = [
+    dont_download_files = {
         downloads_folder / dont_download_filename
         for dont_download_filename in dont_download_filenames
-    ]
+    }
     private = config["Private"]
     public = config["Public"]
 
@@ -595,17 +1053,31 @@ def main() -> None:
     ebible_files = [
         downloads_folder / ebible_filename for ebible_filename in ebible_filenames
     ]
-    existing_ebible_files = [
-        ebible_file for ebible_file in ebible_files if ebible_file.is_file()
-    ]
+    ebible_files_set = set(ebible_files)
+
+    # List the download folder once instead of checking for each file in turn.
+    downloaded_filenames = {
+        entry.name
+        for entry in os.scandir(downloads_folder)
+        if entry.is_file() and entry.name.endswith(file_suffix)
+    }
+    existing_ebible_files = {
+        ebible_file
+        for ebible_file in ebible_files_set
+        if ebible_file.name in downloaded_filenames
+    }
+    # Only the files that are no longer listed are sorted, for the log.
     previous_ebible_files = [
-        file
-        for file in downloads_folder.glob("*" + file_suffix)
-        if file not in ebible_files
+        downloads_folder / filename
+        for filename in sorted(downloaded_filenames.difference(ebible_filenames))
     ]
-    files_to_download = (
-        set(ebible_files) - set(existing_ebible_files) - set(dont_download_files)
-    )
+    # With --force_download the existing files are checked against eBible.org
+    # as well, and fetched again only if they have changed there.
+    files_to_download = ebible_files_set - dont_download_files
+    if not args.force_download:
+        files_to_download -= existing_ebible_files
+    # Sort once so that the downloads are numbered in the same order each run.
+    files_to_download = sorted(files_to_download)
 
     # Presumably any other files used to be in eBible but have been removed
     # Note these in the log file, but don't remove them.
@@ -634,7 +1106,10 @@ def main() -> None:
         downloads_folder,
         logfile,
         redownload=args.force_download,
+        max_workers=args.download_workers,
+        http_cache=http_cache,
     )
+    save_http_cache(http_cache_file, http_cache)
 
     if downloaded_files:
         log_and_print(
@@ -648,64 +1123,84 @@ def main() -> None:
 
     # Unzip all the zipfiles in the download folder to the projects_folder
     # Unless they have already been unzipped to either the projects_folder or private projects_folder
+    # The zip files are the ones found before downloading plus the new downloads.
+    downloaded_filenames.update(
+        downloaded_file.name for downloaded_file in downloaded_files
+    )
     new_projects = unzip_files(
-        zip_files=[zipfile for zipfile in downloads_folder.glob("*" + file_suffix)],
+        zip_files=[
+            downloads_folder / filename for filename in sorted(downloaded_filenames)
+        ],
         unzip_folder=projects_folder,
         also_check=private_projects_folder,
         file_suffix=file_suffix,
         logfile=logfile,
+        overwrite=args.overwrite_extracts,
     )
 
-    project_folders = [project_folder for project_folder in projects_folder.iterdir()]
-    project_foldernames = [project_folder.name for project_folder in project_folders]
-
-    private_project_folders = [
-        private_project_folder
-        for private_project_folder in private_projects_folder.iterdir()
+    # DirEntry.is_dir() uses the file type from the directory listing,
+    # so there is no stat call per project.
+    project_folders = [
+        Path(entry.path) for entry in os.scandir(projects_folder) if entry.is_dir()
     ]
-
-    private_project_foldernames = [
-        private_project_folder.name
-        for private_project_folder in private_project_folders
+    private_project_folders = [
+        Path(entry.path)
+        for entry in os.scandir(private_projects_folder)
+        if entry.is_dir()
     ]
 
-    for private_project_folder in private_project_folders:
-        # Add a Settings.xml file if necessary
-        write_settings_file(private_project_folder)
-
-    for project_folder in project_folders:
-        # Add a Settings.xml file if necessary
-        write_settings_file(project_folder)
+    # Add a Settings.xml file to each project folder if necessary.
+    # Working out the versification reads the USFM files, so share the
+    # projects out between processes.
+    with ProcessPoolExecutor() as executor:
+        list(
+            executor.map(
+                write_settings_file,
+                private_project_folders + project_folders,
+                chunksize=16,
+            )
+        )
 
     # Get projects licence details
-    data = get_licence_details(logfile, projects_folder)
+    # Reuse the folder listings from above rather than scanning again.
+    data = get_licence_details(logfile, projects_folder, project_folders)
 
     # Get private_projects licence details
-    data.extend(get_licence_details(logfile, private_projects_folder))
+    private_data = get_licence_details(
+        logfile, private_projects_folder, private_project_folders
+    )
+    for column, values in private_data.items():
+        data[column].extend(values)
 
     # Don't write and Load-in the extracted licenses.tsv file
     # Instead convert to DataFrame, fix up and write out.
     # licenses_df = pd.read_csv(licence_file, dtype=str)
 
     # Load the licenses data into a pandas dataframe
-    licenses_df = pd.DataFrame.from_records(data)
+    # The dataframe has its own copy of the columns, so free the lists.
+    import pandas as pd
+
+    licenses_df = pd.DataFrame(data)
+    del data
 
     # Fix invalid rows:
     # https://ebible.org/Bible/details.php?id=engwmb
     # https://ebible.org/Bible/details.php?id=engwmbb
 
-    licenses_df.loc[
-        licenses_df["ID"].str.contains("engwmb"), "Copyright Holder"
-    ] = "Public Domain"
+    # These are plain substrings, so don't have pandas compile them as regexes.
+    is_wmb = licenses_df["ID"].str.contains("engwmb", regex=False)
+    licenses_df.loc[is_wmb, "Copyright Holder"] = "Public Domain"
 
     # Correctly set 'public domain' in License Type
     # pd.set_option('display.max_rows', 10)
-    licenses_df.loc[
-        licenses_df["Copyright Holder"].str.contains("Public") == True, "Licence Type"
-    ] = "Public Domain"
+    # Projects without a copyright holder are not public domain.
+    is_public = licenses_df["Copyright Holder"].str.contains(
+        "Public", regex=False, na=False
+    )
+    licenses_df.loc[is_public, "Licence Type"] = "Public Domain"
 
     # Correctly set values for 'Unknown' Licence Type
-    licenses_df.loc[licenses_df["Licence Type"].isna(), "Licence Type"] = "Unknown"
+    licenses_df["Licence Type"] = licenses_df["Licence Type"].fillna("Unknown")
 
     # Write the licence file.
     write_licence_file(licence_file, logfile, licenses_df)
@@ -715,33 +1210,51 @@ def main() -> None:
     log_and_print(logfile, f"{licenses_df['Licence Type'].value_counts()}")
 
     # Get lists of public and private projects from the licences (Note the ~ for NOT!)
-    public_projects_in_licence_file = [project_id for project_id in 
-        licenses_df[~(licenses_df["Licence Type"].str.contains("Unknown"))]["ID"]
-    ]
-
-    private_projects_in_licence_file = [project_id for project_id in licenses_df[
-        licenses_df["Licence Type"].str.contains("Unknown")
-    ]["ID"]]
+    unknown_licence = licenses_df["Licence Type"].eq("Unknown")
+    public_projects_in_licence_file = licenses_df.loc[~unknown_licence, "ID"].tolist()
+    private_projects_in_licence_file = licenses_df.loc[unknown_licence, "ID"].tolist()
 
     
-    public_projects = public_projects_in_licence_file.copy()
-    public_projects.extend(config["Public"])
+    # Use dict keys to drop the IDs listed both in the licences and config.yaml
+    # while keeping their order, so each project is only checked once.
+    # Check the folder listings from above instead of each project folder in turn.
+    # Keep them up to date as projects are moved between the two folders.
+    project_names = {project_folder.name for project_folder in project_folders}
+    private_project_names = {
+        project_folder.name for project_folder in private_project_folders
+    }
+
+    public_projects = list(
+        dict.fromkeys(public_projects_in_licence_file + config["Public"])
+    )
     for public_project in public_projects:
-        misplaced_public_project = private_projects_folder / public_project
-        if misplaced_public_project.is_dir(): 
-            dest = projects_folder / misplaced_public_project.name
+        if public_project in private_project_names:
+            misplaced_public_project = private_projects_folder / public_project
+            dest = projects_folder / public_project
             log_and_print(logfile, f"This project is redistributable and will be moved to the projects folder: {dest}")
-            shutil.move(str(misplaced_public_project), str(dest))
+            # A rename is enough when both folders are on the same filesystem.
+            try:
+                os.replace(misplaced_public_project, dest)
+            except OSError:
+                shutil.move(str(misplaced_public_project), str(dest))
+            private_project_names.discard(public_project)
+            project_names.add(public_project)
 
 
-    private_projects = private_projects_in_licence_file.copy()
-    private_projects.extend(config["Private"])
+    private_projects = list(
+        dict.fromkeys(private_projects_in_licence_file + config["Private"])
+    )
     for private_project in private_projects:
-        misplaced_private_project = projects_folder / private_project
-        if misplaced_private_project.is_dir():
-            dest = private_projects_folder / misplaced_private_project.name
+        if private_project in project_names:
+            misplaced_private_project = projects_folder / private_project
+            dest = private_projects_folder / private_project
             log_and_print(logfile, f"This project is not redistributable and will be moved to the private projects folder: {dest}")
-            shutil.move(str(misplaced_private_project), str(dest))
+            try:
+                os.replace(misplaced_private_project, dest)
+            except OSError:
+                shutil.move(str(misplaced_private_project), str(dest))
+            project_names.discard(private_project)
+            private_project_names.add(private_project)
 
 
     # Move any redistributable projects for the private_projects to the public_projects folder.
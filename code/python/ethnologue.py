@@ -11,6 +11,8 @@ ethnologue_folder = Path('..', '..', 'metadata')
 ethnologue_file = Path(ethnologue_folder, 'languages.tsv')
 exceptions_file = Path(ethnologue_folder, 'exceptions.tsv')
 languages = []
+# A language family name followed by its language count, e.g. "Austronesian (1256)".
+language_family_regex = re.compile(r'(\D+) \(\d+\)')
 
 
 def addLanguage(iso: str, langName: str, langFam: str, langCountry: str):
@@ -64,42 +66,44 @@ def downloadLanguageFamilies(file: Path) -> bool:
     baseUrl = 'https://www.ethnologue.com'
     langFamilyUrl = baseUrl + '/browse/families'
 
-    response = requests.get(langFamilyUrl)
-    if response:
-        root = etree.parse(StringIO(response.text), parser)
-        for element in root.iter('a'):
-            href = element.get('href')
-            if href is not None and href.startswith('/subgroups'):
-                lfCount += 1
-                tokens = re.match(r'(\D+) \(\d+\)', element.text)
-                if tokens:
-                    languageFamily = tokens.group(1)        # Strip off the language count from the name
-                else:
-                    languageFamily = element.text
-                print(f'{lfCount}. Extracting language family {languageFamily}')
-                lfDetailUrl = baseUrl + href
-                time.sleep(1)
-                response = requests.get(lfDetailUrl)
-                if response:
-                    lfDetailRoot = etree.parse(StringIO(response.text), parser)
-                    for langElement in lfDetailRoot.iter('span'):
-                        langClass = langElement.get('class')
-                        if langClass is not None and langClass == 'field-content' and len(langElement):
-                            language = langElement.text.strip()
-                            isoCode = langCountry = ''
-                            for langAttrib in langElement.iter('a'):
-                                langHref = langAttrib.get('href')
-                                if langHref:
-                                    if langHref.startswith('/language'):
-                                        isoCode = langAttrib.text[1: len(langAttrib.text) - 1]
-                                    elif langHref.startswith('/country'):
-                                        langCountry = langAttrib.text
-
-                            langList.append({'languageFamily': languageFamily,
-                                             'language': language,
-                                             'isoCode': isoCode,
-                                             'langCountry': langCountry,
-                                             })
+    # Every page comes from the same host, so keep the connection open between them.
+    with requests.Session() as session:
+        response = session.get(langFamilyUrl)
+        if response:
+            root = etree.parse(StringIO(response.text), parser)
+            for element in root.iter('a'):
+                href = element.get('href')
+                if href is not None and href.startswith('/subgroups'):
+                    lfCount += 1
+                    tokens = language_family_regex.match(element.text)
+                    if tokens:
+                        languageFamily = tokens.group(1)        # Strip off the language count from the name
+                    else:
+                        languageFamily = element.text
+                    print(f'{lfCount}. Extracting language family {languageFamily}')
+                    lfDetailUrl = baseUrl + href
+                    time.sleep(1)
+                    response = session.get(lfDetailUrl)
+                    if response:
+                        lfDetailRoot = etree.parse(StringIO(response.text), parser)
+                        for langElement in lfDetailRoot.iter('span'):
+                            langClass = langElement.get('class')
+                            if langClass is not None and langClass == 'field-content' and len(langElement):
+                                language = langElement.text.strip()
+                                isoCode = langCountry = ''
+                                for langAttrib in langElement.iter('a'):
+                                    langHref = langAttrib.get('href')
+                                    if langHref:
+                                        if langHref.startswith('/language'):
+                                            isoCode = langAttrib.text[1: len(langAttrib.text) - 1]
+                                        elif langHref.startswith('/country'):
+                                            langCountry = langAttrib.text
+
+                                langList.append({'languageFamily': languageFamily,
+                                                 'language': language,
+                                                 'isoCode': isoCode,
+                                                 'langCountry': langCountry,
+                                                 })
 
     writeLanguages(file, langList)
     return True
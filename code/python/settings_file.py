@@ -1,26 +1,22 @@
-import codecs
-from datetime import datetime
 import re
-from glob import iglob
 from os import listdir
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
-# Should not need to duplicate this function in ebible.py and here.
-def log_and_print(file, s, type="Info") -> None:
-
-    with open(file, "a") as log:
-        log.write(
-            f"{type.upper()}: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {s}\n"
-        )
-    print(s)
+# USFM chapter and verse markers, e.g. "\c 3" and "\v 16", found in one pass.
+# Book files are read as bytes, so this matches bytes too.
+marker_regex = re.compile(rb"\\([cv]) ? ?([0-9]+)")
+# Extracted corpus files are named <language>-<project>.txt
+extracted_regex = re.compile(r".+-(.+).txt$")
+# A project with Genesis or Jonah has an Old Testament.
+ot_book_regex = re.compile(r".*GEN|JON.*")
 
 
 def get_extracted_projects(dir_extracted):
 
     extracted = []
     for line in listdir(dir_extracted):
-        m = re.search(r".+-(.+).txt$", line)
+        m = extracted_regex.search(line)
         if m:
             extracted.append(m.group(1))
 
@@ -30,7 +26,7 @@ def get_extracted_projects(dir_extracted):
 def get_books_type(files):
 
     for book in files:
-        m = re.search(r".*GEN|JON.*", book)
+        m = ot_book_regex.search(book)
         if m:
             return "OT+NT"
     return "NT"
@@ -71,71 +67,92 @@ def conclude_versification_from_NT(jhn_6, act_19, rom_16):
     return versification
 
 
-def get_last_verse(project, book, chapter):
+def scan_book(book_file, last_chapter=None) -> Dict[int, int]:
+    """Return the last verse number of each chapter in a USFM book file.
+
+    If last_chapter is given, stop reading when the chapter after it starts.
+    """
+
+    last_verses = {}
+    chapter = None
+    with open(book_file, "rb") as f:
+        for line in f:
+            # Take the markers in the order they appear on the line.
+            for m in marker_regex.finditer(line):
+                if m.group(1) == b"c":
+                    chapter = int(m.group(2))
+                    if last_chapter is not None and chapter > last_chapter:
+                        return last_verses
+                elif chapter is not None:
+                    last_verses[chapter] = int(m.group(2))
+
+    return last_verses
+
 
-    ch = str(chapter)
+def get_last_verses(project, book, chapters, files=None) -> Dict[int, int]:
+    """Return the last verse of each of the chapters, reading the book only once.
 
-    for book_file in iglob(f"{project}/*{book}*"):
-        last_verse = "0"
+    Pass the names of the files in the project to save listing it again.
+    """
+
+    if files is None:
+        files = listdir(project)
+
+    # The same files that glob would match with *{book}*
+    book_files = [
+        Path(project) / file
+        for file in files
+        if book in file and not file.startswith(".")
+    ]
+
+    for book_file in book_files:
         try:
-            f = codecs.open(book_file, "r", encoding="utf-8", errors="ignore")
-        except Exception as e:
-            log_and_print(logfile, f"Could not open {book_file}, reason:  {e}")
+            last_verses = scan_book(book_file, max(chapters))
+        except OSError as e:
+            print(f"Could not open {book_file}, reason:  {e}")
             continue
-        try:
-            in_chapter = False
-            for line in f:
-                m = re.search(r"\\c ? ?([0-9]+).*", line)
-                if m:
-                    if m.group(1) == ch:
-                        in_chapter = True
-                    else:
-                        in_chapter = False
-
-                m = re.search(r"\\v ? ?([0-9]+).*", line)
-                if m:
-                    if in_chapter:
-                        last_verse = m.group(1)
         except Exception as e:
-            log_and_print(
-                logfile, f"Something went wrong in reading {book_file}, reason:  {e}"
-            )
-            return None
-        try:
-            return int(last_verse)
-        except Exception as e:
-            print(
-                f"Could not convert {last_verse} into an integer in {book_file}, reason:  {e}"
-            )
-            return None
+            print(f"Something went wrong in reading {book_file}, reason:  {e}")
+            return dict.fromkeys(chapters)
+
+        return {chapter: last_verses.get(chapter, 0) for chapter in chapters}
+
+    return dict.fromkeys(chapters)
+
+
+def get_last_verse(project, book, chapter):
+    return get_last_verses(project, book, [chapter])[chapter]
+
 
+def get_checkpoints_OT(project, files=None):
+    last_verses = get_last_verses(project, "DAN", [3, 5, 13], files)
 
-def get_checkpoints_OT(project):
-    dan_3 = get_last_verse(project, "DAN", 3)
-    dan_5 = get_last_verse(project, "DAN", 5)
-    dan_13 = get_last_verse(project, "DAN", 13)
+    return last_verses[3], last_verses[5], last_verses[13]
 
-    return dan_3, dan_5, dan_13
 
+def get_checkpoints_NT(project, files=None):
+    if files is None:
+        files = listdir(project)
 
-def get_checkpoints_NT(project):
-    jhn_6 = get_last_verse(project, "JHN", 6)
-    act_19 = get_last_verse(project, "ACT", 19)
-    rom_16 = get_last_verse(project, "ROM", 16)
+    jhn_6 = get_last_verses(project, "JHN", [6], files)[6]
+    act_19 = get_last_verses(project, "ACT", [19], files)[19]
+    rom_16 = get_last_verses(project, "ROM", [16], files)[16]
 
     return jhn_6, act_19, rom_16
 
 
 def get_versification(project):
     versification = ""
-    books = get_books_type(listdir(project))
+    # List the project once for the book type and all the checkpoints.
+    files = listdir(project)
+    books = get_books_type(files)
 
     if books == "OT+NT":
-        dan_3, dan_5, dan_13 = get_checkpoints_OT(project)
+        dan_3, dan_5, dan_13 = get_checkpoints_OT(project, files)
         versification = conclude_versification_from_OT(dan_3, dan_5, dan_13)
 
     if not versification:
-        jhn_6, act_19, rom_16 = get_checkpoints_NT(project)
+        jhn_6, act_19, rom_16 = get_checkpoints_NT(project, files)
         versification = conclude_versification_from_NT(jhn_6, act_19, rom_16)
 
     if versification != "":